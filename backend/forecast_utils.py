@@ -0,0 +1,120 @@
+import calendar
+from datetime import date, datetime
+from itertools import groupby
+
+import numpy as np
+
+
+def format_selected_dates(selected_dates):
+    """Converts frontend dates ('Tue Mar 11 2025') to sorted, unique 'YYYY-MM-DD' strings.
+
+    The calendar appends overlapping ranges as-is, so the same day can arrive
+    more than once; each day is forecast once.
+    """
+    return sorted({datetime.strptime(selected, "%a %b %d %Y").strftime("%Y-%m-%d") for selected in selected_dates})
+
+
+def year_chunks(formatted_dates):
+    """Splits sorted 'YYYY-MM-DD' dates into one list per calendar year."""
+    for _, chunk in groupby(formatted_dates, key=lambda formatted_date: formatted_date[:4]):
+        yield list(chunk)
+
+
+def archive_year(year, today=None):
+    """Returns the archive year whose weather stands in for a forecast year.
+
+    Each year's weather comes from the year before it, capped at the most
+    recent complete year, so forecasts for future years never ask the archive
+    for dates that have not happened yet.
+    """
+    today = today or date.today()
+    return min(year - 1, today.year - 1)
+
+
+def archive_month_day(month, day, year):
+    # Feb 29 has no counterpart in a non-leap year, so fall back to Feb 28
+    if (month, day) == (2, 29) and not calendar.isleap(year):
+        return 2, 28
+    return month, day
+
+
+def archive_weather_range(start_date, end_date, today=None):
+    """Maps a 'YYYY-MM-DD' range within one calendar year onto its archive year's dates."""
+    start_dt = datetime.strptime(start_date, "%Y-%m-%d")
+    end_dt = datetime.strptime(end_date, "%Y-%m-%d")
+    if start_dt.year != end_dt.year:
+        raise ValueError("Weather range must lie within one calendar year")
+
+    weather_year = archive_year(start_dt.year, today)
+    return shift_to_year(start_dt, weather_year), shift_to_year(end_dt, weather_year)
+
+
+def shift_to_year(dt, year):
+    month, day = archive_month_day(dt.month, dt.day, year)
+    return f"{year}-{month:02d}-{day:02d}"
+
+
+def weather_for_dates(weather_records, formatted_dates, today=None):
+    """Pairs each 'YYYY-MM-DD' forecast date with the archive daily summary used for it.
+
+    Records are keyed by the archive's (month, day); each returned record is
+    relabelled with the forecast date, month and day. Dates the archive has no
+    summary for are left out.
+    """
+    weather_dict = {(record["month"], record["day"]): record for record in weather_records}
+    dated_weather = []
+    for formatted_date in formatted_dates:
+        forecast_date = datetime.strptime(formatted_date, "%Y-%m-%d")
+        month, day = archive_month_day(forecast_date.month, forecast_date.day, archive_year(forecast_date.year, today))
+        record = weather_dict.get((month, day))
+        if record is not None:
+            dated_weather.append({**record, "date": formatted_date, "month": forecast_date.month, "day": forecast_date.day})
+    return dated_weather
+
+
+def rollup_daily_predictions(selected_dates, daily_predictions):
+    """Builds the daily and monthly forecast from predictions for the sorted selected dates.
+
+    Predictions are accumulated into a dense day-indexed array covering the
+    whole span, so unselected dates are zero by construction, and monthly totals
+    are an index-based reduction over that array. A date given more than once
+    gets the sum of its predictions.
+    """
+    first_day = np.datetime64(selected_dates[0].date(), "D")
+    day_offsets = np.array(
+        [(date.date() - selected_dates[0].date()).days for date in selected_dates], dtype=np.int64
+    )
+
+    # Dense daily array: one slot per calendar day, zero where no date was selected
+    daily_use = np.zeros(day_offsets.max() + 1, dtype=np.float64)
+    np.add.at(daily_use, day_offsets, daily_predictions)
+    days = first_day + np.arange(daily_use.size)
+
+    # Month index of every day relative to the first month, then sum per month
+    day_months = days.astype("datetime64[M]")
+    month_index = (day_months - day_months[0]).astype(np.int64)
+    monthly_use = np.bincount(month_index, weights=daily_use)
+    months = day_months[0] + np.arange(monthly_use.size)
+
+    all_dates = days.astype(str).tolist()
+    day_year_months = day_months.astype(str).tolist()
+    year_months = months.astype(str).tolist()
+    daily_values = daily_use.tolist()
+    monthly_values = monthly_use.tolist()
+
+    total_energy_usage = round(float(daily_use.sum()), 2)
+    total_monthly_forecast = round(float(monthly_use.sum()), 2)
+
+    return {
+        "totalEnergyUsage": total_energy_usage,
+        "predicted_energy": [
+            {"date": date, "predicted_use": use, "year_month": year_month}
+            for date, use, year_month in zip(all_dates, daily_values, day_year_months)
+        ],
+        "monthly_forecast": [
+            {"year_month": year_month, "predicted_use": use}
+            for year_month, use in zip(year_months, monthly_values)
+        ],
+        "total_monthly_forecast": total_monthly_forecast,
+        "all_dates": all_dates  # ✅ Includes all dates
+    }
@@ -1,19 +1,24 @@
 import os
 import json
+import hashlib
 import mysql.connector
 import requests
-import csv
 from datetime import datetime
 from fastapi import FastAPI, HTTPException, Depends
 from pydantic import BaseModel, validator
 from typing import Dict, List, Optional
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.concurrency import run_in_threadpool
 import pickle
 import pandas as pd
 import numpy as np
 from collections import defaultdict
 import google.generativeai as genai
 from dotenv import load_dotenv
+from forecast_utils import (
+    archive_weather_range, format_selected_dates, rollup_daily_predictions, weather_for_dates, year_chunks
+)
+from singleflight import SingleFlight
 
 
 app = FastAPI(title="Energy Consumption Prediction API")
@@ -42,9 +47,38 @@ def get_db():
         database=os.getenv("DB_NAME"),
         buffered=True
     )
-with open("../lightgbm_model10.pkl", "rb") as model_file:
+MODEL_PATH = "../lightgbm_model10.pkl"
+# Stored with every forecast so history from different models is never mixed
+MODEL_VERSION = os.getenv("MODEL_VERSION", os.path.splitext(os.path.basename(MODEL_PATH))[0])
+
+with open(MODEL_PATH, "rb") as model_file:
     model = pickle.load(model_file)
 
+# Daily forecast history, keyed so re-running the same forecast overwrites it
+FORECASTS_TABLE_DDL = """
+    CREATE TABLE IF NOT EXISTS forecasts (
+        location_id INT NOT NULL,
+        profile_hash CHAR(16) NOT NULL,
+        model_version VARCHAR(64) NOT NULL,
+        forecast_date DATE NOT NULL,
+        kwh DOUBLE NOT NULL,
+        PRIMARY KEY (location_id, profile_hash, model_version, forecast_date),
+        INDEX idx_forecasts_profile (profile_hash, model_version, forecast_date),
+        INDEX idx_forecasts_model_date (model_version, forecast_date)
+    )
+"""
+
+@app.on_event("startup")
+def create_forecast_store():
+    try:
+        db = get_db()
+        cursor = db.cursor()
+        cursor.execute(FORECASTS_TABLE_DDL)
+        db.commit()
+        db.close()
+    except Exception as e:
+        print("Error creating forecasts table:", str(e))
+
 
 appliance_mapping = {
     "Dishwasher": "Dishwasher",
@@ -76,6 +110,11 @@ default_weather = {
     "precipProbability": 0
 }
 
+# One coalescing group per upstream service
+weather_flight = SingleFlight("weather")
+consumption_flight = SingleFlight("consumption")
+tariff_flight = SingleFlight("tariff")
+
 class Appliance(BaseModel):
     power: float
     count: int
@@ -111,6 +150,10 @@ class EnergyRequest(BaseModel):
 
 # Data Fetching Utilities
 def fetch_past_consumption(consumer_id: str):
+    # Households sharing a consumer number share one in-flight KSEB lookup
+    return consumption_flight.do(consumer_id.strip(), _fetch_past_consumption, consumer_id.strip())
+
+def _fetch_past_consumption(consumer_id: str):
     try:
         headers = {"Content-Type": "application/x-www-form-urlencoded; charset=UTF-8"}
         response = requests.post(KSEB_API_URL, headers=headers, data={"optionVal": consumer_id})
@@ -147,92 +190,97 @@ def fetch_historical_weather(location: str, start_date: str, end_date: str):
 
         lat, lon = match[0].split(":")[1], match[1].split(":")[1]
 
-        # Convert start_date and end_date to previous year's same month and day
-        start_dt = datetime.strptime(start_date, "%Y-%m-%d")
-        end_dt = datetime.strptime(end_date, "%Y-%m-%d")
-        print(f"start_dt: {start_dt}, end_dt: {end_dt}")  # Debugging log
-        previous_year = start_dt.year - 1  # Use previous year
-        start_date_prev_year = f"{previous_year}-{start_dt.month:02d}-{start_dt.day:02d}"
-        end_date_prev_year = f"{previous_year}-{end_dt.month:02d}-{end_dt.day:02d}"
-
-        # API call to fetch historical weather data
-        response = requests.get("https://archive-api.open-meteo.com/v1/archive", params={
-            "latitude": lat.strip(),
-            "longitude": lon.strip(),
-            "start_date": start_date_prev_year,
-            "end_date": end_date_prev_year,
-            "hourly": "temperature_2m,relative_humidity_2m,visibility,surface_pressure,wind_speed_10m,cloud_cover,wind_direction_10m,precipitation,precipitation_probability"
-        })
-
-        # Parse JSON response
-        weather_data = response.json()
-        if not isinstance(weather_data, dict) or "hourly" not in weather_data:
-            raise ValueError(f"Unexpected API response format: {weather_data}")
-
-        hourly_data = weather_data["hourly"]
-        if not isinstance(hourly_data, dict):
-            raise ValueError(f"Unexpected format for 'hourly' data: {hourly_data}")
-
-        # Extract hourly weather details safely
-        times = hourly_data.get("time", [])
-        temperatures = [temp if temp is not None else 0 for temp in hourly_data.get("temperature_2m", [0] * len(times))]
-        humidities = [hum if hum is not None else 0 for hum in hourly_data.get("relative_humidity_2m", [0] * len(times))]
-        visibilities = [vis if vis is not None else 0 for vis in hourly_data.get("visibility", [0] * len(times))]
-        pressures = [pres if pres is not None else 0 for pres in hourly_data.get("surface_pressure", [0] * len(times))]
-        wind_speeds = [wind if wind is not None else 0 for wind in hourly_data.get("wind_speed_10m", [0] * len(times))]
-        cloud_covers = [cloud if cloud is not None else 0 for cloud in hourly_data.get("cloud_cover", [0] * len(times))]
-        wind_bearings = [wind_bear if wind_bear is not None else 0 for wind_bear in hourly_data.get("wind_direction_10m", [0] * len(times))]
-        precip_intensities = [precip if precip is not None else 0 for precip in hourly_data.get("precipitation", [0] * len(times))]
-        precip_probabilities = [precip_prob if precip_prob is not None else 0 for precip_prob in hourly_data.get("precipitation_probability", [0] * len(times))]
-
-        daily_data = defaultdict(lambda: {
-            "temperature": [],
-            "humidity": [],
-            "wind_speed": [],
-            "visibility": [],
-            "pressure": [],
-            "cloud_cover": [],
-            "wind_bearing": [],
-            "precip_intensity": [],
-            "precip_probability": []
-        })
+        # Convert start_date and end_date to the same month and day of the archive year
+        start_date_prev_year, end_date_prev_year = archive_weather_range(start_date, end_date)
+        print(f"archive range: {start_date_prev_year} to {end_date_prev_year}")  # Debugging log
 
-        for i in range(len(times)):
-            dt = datetime.strptime(times[i], "%Y-%m-%dT%H:%M")
-            key = (dt.month, dt.day)  # Use month and day as key
-
-            daily_data[key]["temperature"].append(temperatures[i])
-            daily_data[key]["humidity"].append(humidities[i])
-            daily_data[key]["wind_speed"].append(wind_speeds[i])
-            daily_data[key]["visibility"].append(visibilities[i])
-            daily_data[key]["pressure"].append(pressures[i])
-            daily_data[key]["cloud_cover"].append(cloud_covers[i])
-            daily_data[key]["wind_bearing"].append(wind_bearings[i])
-            daily_data[key]["precip_intensity"].append(precip_intensities[i])
-            daily_data[key]["precip_probability"].append(precip_probabilities[i])
-
-        # Calculate daily averages
-        daily_summary = []
-        for (month, day), values in daily_data.items():
-            daily_summary.append({
-                "month": month,
-                "day": day,
-                "avg_temperature": sum(values["temperature"]) / len(values["temperature"]),
-                "avg_humidity": sum(values["humidity"]) / len(values["humidity"]),
-                "avg_wind_speed": sum(values["wind_speed"]) / len(values["wind_speed"]),
-                "avg_visibility": sum(values["visibility"]) / len(values["visibility"]),
-                "avg_pressure": sum(values["pressure"]) / len(values["pressure"]),
-                "avg_cloud_cover": sum(values["cloud_cover"]) / len(values["cloud_cover"]),
-                "avg_wind_bearing": sum(values["wind_bearing"]) / len(values["wind_bearing"]),
-                "avg_precip_intensity": sum(values["precip_intensity"]) / len(values["precip_intensity"]),
-                "avg_precip_probability": sum(values["precip_probability"]) / len(values["precip_probability"])
-            })
-        print(f"data is {daily_summary}")
-        return daily_summary
+        # Concurrent requests for the same area and period share one archive query
+        key = (round(float(lat), 4), round(float(lon), 4), start_date_prev_year, end_date_prev_year)
+        return weather_flight.do(
+            key, _fetch_weather_archive, lat.strip(), lon.strip(), start_date_prev_year, end_date_prev_year
+        )
 
     except Exception as e:
         print("Error fetching historical weather data:", str(e))
         return None
+
+
+def _fetch_weather_archive(lat: str, lon: str, start_date: str, end_date: str):
+    """Fetches hourly archive weather and summarizes it per (month, day)."""
+    # API call to fetch historical weather data
+    response = requests.get("https://archive-api.open-meteo.com/v1/archive", params={
+        "latitude": lat,
+        "longitude": lon,
+        "start_date": start_date,
+        "end_date": end_date,
+        "hourly": "temperature_2m,relative_humidity_2m,visibility,surface_pressure,wind_speed_10m,cloud_cover,wind_direction_10m,precipitation,precipitation_probability"
+    })
+
+    # Parse JSON response
+    weather_data = response.json()
+    if not isinstance(weather_data, dict) or "hourly" not in weather_data:
+        raise ValueError(f"Unexpected API response format: {weather_data}")
+
+    hourly_data = weather_data["hourly"]
+    if not isinstance(hourly_data, dict):
+        raise ValueError(f"Unexpected format for 'hourly' data: {hourly_data}")
+
+    # Extract hourly weather details safely
+    times = hourly_data.get("time", [])
+    temperatures = [temp if temp is not None else 0 for temp in hourly_data.get("temperature_2m", [0] * len(times))]
+    humidities = [hum if hum is not None else 0 for hum in hourly_data.get("relative_humidity_2m", [0] * len(times))]
+    visibilities = [vis if vis is not None else 0 for vis in hourly_data.get("visibility", [0] * len(times))]
+    pressures = [pres if pres is not None else 0 for pres in hourly_data.get("surface_pressure", [0] * len(times))]
+    wind_speeds = [wind if wind is not None else 0 for wind in hourly_data.get("wind_speed_10m", [0] * len(times))]
+    cloud_covers = [cloud if cloud is not None else 0 for cloud in hourly_data.get("cloud_cover", [0] * len(times))]
+    wind_bearings = [wind_bear if wind_bear is not None else 0 for wind_bear in hourly_data.get("wind_direction_10m", [0] * len(times))]
+    precip_intensities = [precip if precip is not None else 0 for precip in hourly_data.get("precipitation", [0] * len(times))]
+    precip_probabilities = [precip_prob if precip_prob is not None else 0 for precip_prob in hourly_data.get("precipitation_probability", [0] * len(times))]
+
+    daily_data = defaultdict(lambda: {
+        "temperature": [],
+        "humidity": [],
+        "wind_speed": [],
+        "visibility": [],
+        "pressure": [],
+        "cloud_cover": [],
+        "wind_bearing": [],
+        "precip_intensity": [],
+        "precip_probability": []
+    })
+
+    for i in range(len(times)):
+        dt = datetime.strptime(times[i], "%Y-%m-%dT%H:%M")
+        key = (dt.month, dt.day)  # Use month and day as key
+
+        daily_data[key]["temperature"].append(temperatures[i])
+        daily_data[key]["humidity"].append(humidities[i])
+        daily_data[key]["wind_speed"].append(wind_speeds[i])
+        daily_data[key]["visibility"].append(visibilities[i])
+        daily_data[key]["pressure"].append(pressures[i])
+        daily_data[key]["cloud_cover"].append(cloud_covers[i])
+        daily_data[key]["wind_bearing"].append(wind_bearings[i])
+        daily_data[key]["precip_intensity"].append(precip_intensities[i])
+        daily_data[key]["precip_probability"].append(precip_probabilities[i])
+
+    # Calculate daily averages
+    daily_summary = []
+    for (month, day), values in daily_data.items():
+        daily_summary.append({
+            "month": month,
+            "day": day,
+            "avg_temperature": sum(values["temperature"]) / len(values["temperature"]),
+            "avg_humidity": sum(values["humidity"]) / len(values["humidity"]),
+            "avg_wind_speed": sum(values["wind_speed"]) / len(values["wind_speed"]),
+            "avg_visibility": sum(values["visibility"]) / len(values["visibility"]),
+            "avg_pressure": sum(values["pressure"]) / len(values["pressure"]),
+            "avg_cloud_cover": sum(values["cloud_cover"]) / len(values["cloud_cover"]),
+            "avg_wind_bearing": sum(values["wind_bearing"]) / len(values["wind_bearing"]),
+            "avg_precip_intensity": sum(values["precip_intensity"]) / len(values["precip_intensity"]),
+            "avg_precip_probability": sum(values["precip_probability"]) / len(values["precip_probability"])
+        })
+    print(f"data is {daily_summary}")
+    return daily_summary
     
 
 def get_actual_usage(appliance_name, date, energy_request):
@@ -358,33 +406,47 @@ def generate_simulated_data(appliances, weather_records, selected_dates):
     
     return df
 
-def save_data_to_csv(data):
-    """Saves the simulated data to a CSV file."""
-    file_path = "simulated_data.csv"
-    
-    if isinstance(data, pd.DataFrame):
-        data.to_csv(file_path, index=False)  # Directly save Pandas DataFrame
-    elif isinstance(data, list) and data:  # Handle list of dicts
-        with open(file_path, "w", newline="") as csvfile:
-            writer = csv.DictWriter(csvfile, fieldnames=list(data[0].keys()))
-            writer.writeheader()
-            writer.writerows(data)
-    else:
-        raise ValueError("Invalid data format for CSV export")
+def appliance_profile_hash(appliances):
+    """Returns a short stable hash of the appliance profile a forecast was made for."""
+    profile = {
+        name.strip(): {
+            "power": float(appliance.power),
+            "count": int(appliance.count),
+            "usageTime": appliance.usageTime.strip(),
+            "days": sorted(appliance.days)
+        }
+        for name, appliance in appliances.items()
+    }
+    encoded = json.dumps(profile, sort_keys=True, separators=(",", ":")).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()[:16]
 
-    print(f"CSV saved successfully: {file_path}")  # Debugging Log
-    return file_path
+
+def store_forecasts(cursor, location_id, profile_hash, predicted_energy, forecast_dates):
+    """Bulk-writes the daily predictions for the forecast dates into the forecasts table."""
+    forecast_dates = set(forecast_dates)
+    rows = [
+        (location_id, profile_hash, MODEL_VERSION, entry["date"], float(entry["predicted_use"]))
+        for entry in predicted_energy
+        if entry["date"] in forecast_dates
+    ]
+    if not rows:
+        return 0
+
+    cursor.executemany("""
+        INSERT INTO forecasts (location_id, profile_hash, model_version, forecast_date, kwh)
+        VALUES (%s, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE kwh = VALUES(kwh)
+    """, rows)
+    return len(rows)
 
 
 
 
 # Retrieve API URL from .env
 
-def predict_energy_usage(csv_file_path, appliance_power_ratings, min_use, energy_request):
+def predict_energy_usage(data, selected_dates, appliance_power_ratings, min_use, energy_request):
+    """Scores simulated rows for the sorted selected dates and returns denormalized daily kWh."""
     try:
-        # Load simulated data from CSV
-        data = pd.read_csv(csv_file_path)
-
         # Ensure feature columns match model expectations
         feature_columns = getattr(model, "feature_names_in_", data.columns)  
         data = data[feature_columns]
@@ -393,9 +455,6 @@ def predict_energy_usage(csv_file_path, appliance_power_ratings, min_use, energy
         # Predict energy consumption (normalized values)
         predictions = model.predict(data)
         print(f"Predictions: {predictions}")  # Debugging log
-
-        # Convert selected dates to datetime format
-        selected_dates = sorted([datetime.strptime(date, "%a %b %d %Y") for date in energy_request.selectedDates])
         print(f"Selected Dates: {selected_dates}")  # Debugging log
 
         # Compute daily max_use dynamically
@@ -414,54 +473,73 @@ def predict_energy_usage(csv_file_path, appliance_power_ratings, min_use, energy
         # Handle division by zero by setting to a small value
 
         # Denormalize predictions using daily max_use
-        denormalized_predictions = predictions * (max_use_per_day - min_use) + min_use
+        return predictions * (max_use_per_day - min_use) + min_use
 
-        # Create DataFrame
-        prediction_df = pd.DataFrame({
-            "date": selected_dates,
-            "predicted_use": denormalized_predictions
-        })
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Prediction error: {str(e)}")
+
+
+def iter_forecast_chunks(appliances, location, formatted_dates, appliance_power_ratings, min_use, energy_request):
+    """Yields (dates, predictions, weather) for each calendar year of the sorted selected dates.
+
+    Each chunk's weather is fetched from its archive year, simulated and scored
+    on its own, so only one year of hourly weather and features is held in
+    memory at a time however long the selected range is. The weather yielded is
+    one record per selected date, not the chunk's whole archive summary.
+    """
+    for chunk_dates in year_chunks(formatted_dates):
+        print(f"Forecasting {chunk_dates[0]} to {chunk_dates[-1]}")  # Debugging log
+
+        try:
+            archive_weather = fetch_historical_weather(location, chunk_dates[0], chunk_dates[-1])
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Weather data fetch error: {str(e)}")
+        if not archive_weather:
+            raise HTTPException(status_code=400, detail="Could not fetch weather data")
 
-        # Convert 'date' to datetime format before merging
-        prediction_df["date"] = pd.to_datetime(prediction_df["date"])
+        # Relabel archive days as forecast dates so leap days find Feb 28 when the archive year has none
+        weather_data = weather_for_dates(archive_weather, chunk_dates)
 
-        # Ensure a complete date range, filling missing dates with zero consumption
-        full_date_range = pd.date_range(start=min(selected_dates), end=max(selected_dates))
-        full_prediction_df = pd.DataFrame({"date": full_date_range})
+        try:
+            simulated_data = generate_simulated_data(appliances, weather_data, chunk_dates)
+            if simulated_data.empty:
+                raise HTTPException(status_code=500, detail="Simulated data is empty")
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Simulation error: {str(e)}")
 
-        # Merge with predictions, filling missing values with 0
-        full_prediction_df = full_prediction_df.merge(prediction_df, on="date", how="left").fillna(0)
+        selected_dates = [datetime.strptime(date, "%Y-%m-%d") for date in chunk_dates]
+        predictions = predict_energy_usage(simulated_data, selected_dates, appliance_power_ratings, min_use, energy_request)
+        yield selected_dates, predictions, weather_data
 
-        # Convert date column to string for output
-        full_prediction_df["date"] = full_prediction_df["date"].dt.strftime("%Y-%m-%d")
 
-        # Group by month & sum predicted use
-        full_prediction_df["year_month"] = pd.to_datetime(full_prediction_df["date"]).dt.to_period("M")
-        monthly_totals = full_prediction_df.groupby("year_month")["predicted_use"].sum().reset_index()
+def forecast_selected_dates(appliances, location, formatted_dates, appliance_power_ratings, min_use, energy_request):
+    """Runs the chunked forecast pipeline and merges chunk results as they arrive."""
+    selected_dates = []
+    daily_predictions = np.empty(len(formatted_dates), dtype=np.float64)
+    weather_data = []
 
-        # Convert year_month to string
-        monthly_totals["year_month"] = monthly_totals["year_month"].astype(str)
+    for chunk_dates, predictions, chunk_weather in iter_forecast_chunks(
+        appliances, location, formatted_dates, appliance_power_ratings, min_use, energy_request
+    ):
+        daily_predictions[len(selected_dates):len(selected_dates) + len(chunk_dates)] = predictions
+        selected_dates.extend(chunk_dates)
+        weather_data.extend(chunk_weather)
 
-        # Sum total energy usage after filling missing dates
-        total_energy_usage = round(full_prediction_df["predicted_use"].sum(), 2)
-        all_dates = full_prediction_df["date"].tolist()
-        total_monthly_forecast = round(monthly_totals["predicted_use"].sum(), 2)
+    prediction_result = rollup_daily_predictions(selected_dates, daily_predictions)
+    print(f"Monthly Totals: {prediction_result['monthly_forecast']}")  # Debugging log
+    print(f"Total Monthly Forecast: {prediction_result['total_monthly_forecast']}")  # Debugging log
+    return prediction_result, weather_data
 
-        print(f"Final Prediction Data: {full_prediction_df}")  # Debugging log
-        print(f"Monthly Totals: {monthly_totals}")  # Debugging log
-        print(f"All Dates: {all_dates}")  # Debugging log
-        print(f"Total Monthly Forecast: {total_monthly_forecast}")  # Debugging log
 
-        return {
-            "totalEnergyUsage": total_energy_usage,
-            "predicted_energy": full_prediction_df.to_dict(orient="records"),
-            "monthly_forecast": monthly_totals.to_dict(orient="records"),
-            "total_monthly_forecast": total_monthly_forecast,
-            "all_dates": all_dates  # ✅ Includes all dates
-        }
+def fetch_tariff(payload):
+    # Identical tariff queries (same units, frequency and phase) share one in-flight call
+    return tariff_flight.do(tuple(sorted(payload.items())), _fetch_tariff, payload)
 
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Prediction error: {str(e)}")
+def _fetch_tariff(payload):
+    headers = {"Content-Type": "application/x-www-form-urlencoded; charset=UTF-8"}
+    response = requests.post(API_URL, headers=headers, data=payload)
+    response.raise_for_status()
+    return response.json()
 
 
 def calculate_bill_amount(consumption_data, phase):
@@ -491,13 +569,10 @@ def calculate_bill_amount(consumption_data, phase):
             "phase": formatted_phase
         }
 
-        headers = {"Content-Type": "application/x-www-form-urlencoded; charset=UTF-8"}
         month = consumption_data[0]["month"]
 
         try:
-            response = requests.post(API_URL, headers=headers, data=payload)
-            response.raise_for_status()
-            data = response.json()
+            data = fetch_tariff(payload)
 
             if data.get("err_flag") == 0 and "result_data" in data:
                 bill_value = data["result_data"].get("tariff_values", {}).get("bill_total", {}).get("value", 0)
@@ -587,7 +662,8 @@ async def predict_energy(request: EnergyRequest, db=Depends(get_db)):
 
     if request.consumerNo:
         try:
-            past_consumption_data = fetch_past_consumption(request.consumerNo)
+            # Upstream fetches block, so run them in the threadpool where concurrent identical calls coalesce
+            past_consumption_data = await run_in_threadpool(fetch_past_consumption, request.consumerNo)
             past_consumption_data = format_consumption_data(past_consumption_data)
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Error fetching past consumption: {str(e)}")
@@ -608,19 +684,10 @@ async def predict_energy(request: EnergyRequest, db=Depends(get_db)):
 
     # Convert date format to YYYY-MM-DD
     try:
-        formatted_dates = sorted([datetime.strptime(date, "%a %b %d %Y").strftime("%Y-%m-%d") for date in request.selectedDates])
-        start_date, end_date = formatted_dates[0], formatted_dates[-1]
+        formatted_dates = format_selected_dates(request.selectedDates)
     except ValueError:
         raise HTTPException(status_code=400, detail="Invalid date format. Expected 'Tue Mar 11 2025' format")
 
-    # Fetch and store historical weather data
-    try:
-        weather_data = fetch_historical_weather(location, start_date, end_date)
-        if not weather_data:
-            raise HTTPException(status_code=400, detail="Could not fetch weather data")
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Weather data fetch error: {str(e)}")
-    
     # Insert appliances into the database
     try:
         for appliance_name, appliance in appliances.items():
@@ -645,16 +712,7 @@ async def predict_energy(request: EnergyRequest, db=Depends(get_db)):
         db.rollback()
         raise HTTPException(status_code=500, detail=f"Error inserting appliances: {str(e)}")
 
-    # Simulate data and save to CSV
-    try:
-        simulated_data = generate_simulated_data(appliances, weather_data, formatted_dates)
-        if simulated_data.empty:
-            raise HTTPException(status_code=500, detail="Simulated data is empty")
-        csv_file_path = save_data_to_csv(simulated_data)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Simulation error: {str(e)}")
-
-    # Run prediction using the trained LightGBM model
+    # Fetch weather, simulate and run the trained LightGBM model one calendar year at a time
     try:
         min_use=0
         appliance_power_ratings = {
@@ -662,12 +720,13 @@ async def predict_energy(request: EnergyRequest, db=Depends(get_db)):
     for name, appliance in appliances.items()
 }
 
-        print(f"CSV Path: {csv_file_path}")
         print(f"Appliance Power Ratings: {appliance_power_ratings}")  # Ensure keys are strings
         print(f"Type of appliance_power_ratings: {type(appliance_power_ratings)}")
 
 
-        prediction_result = predict_energy_usage(csv_file_path, appliance_power_ratings, min_use, request)
+        prediction_result, weather_data = await run_in_threadpool(
+            forecast_selected_dates, appliances, location, formatted_dates, appliance_power_ratings, min_use, request
+        )
         print(f"Raw prediction result{prediction_result}")
 
         if not prediction_result or not isinstance(prediction_result, dict):
@@ -685,20 +744,31 @@ async def predict_energy(request: EnergyRequest, db=Depends(get_db)):
 ]
 
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Prediction error: {str(e)}")
+
+    # Persist the daily forecast so history views can be served without re-running inference.
+    # History is best-effort: a failed write must not discard a prediction that already succeeded.
+    profile_hash = appliance_profile_hash(appliances)
+    try:
+        store_forecasts(cursor, location_id, profile_hash, prediction_result["predicted_energy"], formatted_dates)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        print("Error storing forecast history:", str(e))
+
     total_monthly_forecast = prediction_result.get("total_monthly_forecast", 0)
     print(f"appliances:{request.appliances}")
     print(f"consumption data :{consumption_data}")
+    bill_amount = await run_in_threadpool(calculate_bill_amount, consumption_data, request.phase)
    
 
     return {
         "prediction": prediction_result,
         "totalMonthlyForecast": total_monthly_forecast,
-        "billAmount": calculate_bill_amount(
-            consumption_data, 
-            request.phase
-),
+        "billAmount": bill_amount,
         "recommendations": get_recommendations(
     prediction_result["predicted_energy"],
     past_consumption_data,
@@ -706,7 +776,9 @@ async def predict_energy(request: EnergyRequest, db=Depends(get_db)):
     ),
         "pastConsumption": past_consumption_data,  # Include past consumption in response
         "weatherData": weather_data,  # Include weather data
-        "consumptionData": consumption_data  # Include consumption data for graph
+        "consumptionData": consumption_data,  # Include consumption data for graph
+        "profileHash": profile_hash,  # Key for reading this forecast back from /forecasts
+        "modelVersion": MODEL_VERSION
     }
 
 
@@ -719,6 +791,90 @@ async def submit_data(request: EnergyRequest, db=Depends(get_db)):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
 
+@app.get("/forecasts")
+def get_forecasts(
+    granularity: str = "daily",
+    location: Optional[str] = None,
+    profileHash: Optional[str] = None,
+    modelVersion: Optional[str] = None,
+    startDate: Optional[str] = None,
+    endDate: Optional[str] = None,
+    db=Depends(get_db)
+):
+    """Serves stored forecast history as daily, monthly or per-location kWh totals."""
+    if granularity not in ("daily", "monthly", "location"):
+        raise HTTPException(status_code=400, detail="granularity must be 'daily', 'monthly' or 'location'")
+
+    # A location filter uses the primary key, a profileHash filter uses idx_forecasts_profile
+    # and otherwise the model version and date range use idx_forecasts_model_date
+    conditions, params = [], []
+    if location:
+        conditions.append("l.location_name = %s")
+        params.append(location)
+    if profileHash:
+        conditions.append("f.profile_hash = %s")
+        params.append(profileHash)
+    conditions.append("f.model_version = %s")
+    params.append(modelVersion or MODEL_VERSION)
+    try:
+        if startDate:
+            conditions.append("f.forecast_date >= %s")
+            params.append(datetime.strptime(startDate, "%Y-%m-%d").date())
+        if endDate:
+            conditions.append("f.forecast_date <= %s")
+            params.append(datetime.strptime(endDate, "%Y-%m-%d").date())
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid date format. Expected 'YYYY-MM-DD' format")
+
+    # Totals aggregate across appliance profiles (narrowed to one when profileHash is given);
+    # the number of profiles behind each total is reported alongside it
+    group_columns = {
+        "daily": "f.forecast_date",
+        "monthly": "YEAR(f.forecast_date), MONTH(f.forecast_date)",
+        "location": "l.location_name"
+    }[granularity]
+
+    query = f"""
+        SELECT {group_columns}, SUM(f.kwh), COUNT(DISTINCT f.forecast_date), COUNT(DISTINCT f.profile_hash)
+        FROM forecasts f
+        JOIN locations l ON l.id = f.location_id
+        WHERE {" AND ".join(conditions)}
+        GROUP BY {group_columns}
+        ORDER BY {group_columns}
+    """
+
+    try:
+        cursor = db.cursor()
+        cursor.execute(query, tuple(params))
+        rows = cursor.fetchall()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+
+    forecasts = []
+    total_energy_usage = 0.0
+    for row in rows:
+        *period, kwh, days, profiles = row
+        if granularity == "daily":
+            entry = {"date": period[0].strftime("%Y-%m-%d")}
+        elif granularity == "monthly":
+            entry = {"year_month": f"{period[0]:04d}-{period[1]:02d}"}
+        else:
+            entry = {"location": period[0]}
+        entry.update({"predicted_use": round(float(kwh), 2), "days": days, "profiles": profiles})
+        forecasts.append(entry)
+        total_energy_usage += float(kwh)
+
+    return {
+        "granularity": granularity,
+        "profileHash": profileHash,
+        "forecasts": forecasts,
+        "totalEnergyUsage": round(total_energy_usage, 2)
+    }
+
+@app.get("/metrics/coalescing")
+def coalescing_metrics():
+    return {flight.name: flight.stats() for flight in (weather_flight, consumption_flight, tariff_flight)}
+
 @app.get("/")
 def home():
     return {"message": "Welcome to Energy Prediction API"}
@@ -0,0 +1,54 @@
+import threading
+
+
+class SingleFlight:
+    """Coalesces concurrent calls with the same key into one upstream call.
+
+    The first caller for a key runs the fetch; callers arriving while it is in
+    flight wait for it and share its result (or its exception).
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._lock = threading.Lock()
+        self._in_flight = {}
+        self.calls = 0
+        self.upstream_calls = 0
+
+    def do(self, key, fetch, *args, **kwargs):
+        with self._lock:
+            self.calls += 1
+            call = self._in_flight.get(key)
+            is_leader = call is None
+            if is_leader:
+                call = {"done": threading.Event(), "result": None, "error": None}
+                self._in_flight[key] = call
+                self.upstream_calls += 1
+
+        if not is_leader:
+            call["done"].wait()
+            if call["error"] is not None:
+                raise call["error"]
+            return call["result"]
+
+        try:
+            call["result"] = fetch(*args, **kwargs)
+            return call["result"]
+        except BaseException as e:
+            # Record cancellation and exit too, so waiters never mistake them for a None result
+            call["error"] = e
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+            call["done"].set()
+
+    def stats(self):
+        with self._lock:
+            calls, upstream_calls = self.calls, self.upstream_calls
+        return {
+            "calls": calls,
+            "upstreamCalls": upstream_calls,
+            "coalescedCalls": calls - upstream_calls,
+            "coalescingRatio": round((calls - upstream_calls) / calls, 4) if calls else 0.0
+        }
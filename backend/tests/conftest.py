@@ -0,0 +1,5 @@
+import os
+import sys
+
+# main.py is run from backend/, so its sibling modules are imported by bare name
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
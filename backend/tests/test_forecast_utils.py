@@ -0,0 +1,201 @@
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from forecast_utils import (
+    archive_weather_range, format_selected_dates, rollup_daily_predictions, weather_for_dates, year_chunks
+)
+
+
+def baseline_rollup(selected_dates, denormalized_predictions):
+    """The merge/fillna/to_period rollup predict_energy_usage used before the dense-array rewrite."""
+    prediction_df = pd.DataFrame({"date": selected_dates, "predicted_use": denormalized_predictions})
+    prediction_df["date"] = pd.to_datetime(prediction_df["date"])
+    full_date_range = pd.date_range(start=min(selected_dates), end=max(selected_dates))
+    full_prediction_df = pd.DataFrame({"date": full_date_range})
+    full_prediction_df = full_prediction_df.merge(prediction_df, on="date", how="left").fillna(0)
+    full_prediction_df["date"] = full_prediction_df["date"].dt.strftime("%Y-%m-%d")
+    full_prediction_df["year_month"] = pd.to_datetime(full_prediction_df["date"]).dt.to_period("M")
+    monthly_totals = full_prediction_df.groupby("year_month")["predicted_use"].sum().reset_index()
+    monthly_totals["year_month"] = monthly_totals["year_month"].astype(str)
+    full_prediction_df["year_month"] = full_prediction_df["year_month"].astype(str)
+    return {
+        "totalEnergyUsage": round(full_prediction_df["predicted_use"].sum(), 2),
+        "predicted_energy": full_prediction_df.to_dict(orient="records"),
+        "monthly_forecast": monthly_totals.to_dict(orient="records"),
+        "total_monthly_forecast": round(monthly_totals["predicted_use"].sum(), 2),
+        "all_dates": full_prediction_df["date"].tolist()
+    }
+
+
+def to_datetimes(dates):
+    return [datetime.strptime(date, "%Y-%m-%d") for date in dates]
+
+
+def assert_rollups_match(result, expected):
+    assert result["all_dates"] == expected["all_dates"]
+    assert [row["date"] for row in result["predicted_energy"]] == [row["date"] for row in expected["predicted_energy"]]
+    assert [row["year_month"] for row in result["predicted_energy"]] == [row["year_month"] for row in expected["predicted_energy"]]
+    assert [row["predicted_use"] for row in result["predicted_energy"]] == pytest.approx(
+        [row["predicted_use"] for row in expected["predicted_energy"]]
+    )
+    assert [row["year_month"] for row in result["monthly_forecast"]] == [row["year_month"] for row in expected["monthly_forecast"]]
+    assert [row["predicted_use"] for row in result["monthly_forecast"]] == pytest.approx(
+        [row["predicted_use"] for row in expected["monthly_forecast"]]
+    )
+    assert result["totalEnergyUsage"] == pytest.approx(expected["totalEnergyUsage"], abs=0.01)
+    assert result["total_monthly_forecast"] == pytest.approx(expected["total_monthly_forecast"], abs=0.01)
+
+
+@pytest.mark.parametrize("dates", [
+    # Gaps inside a month
+    ["2025-03-03", "2025-03-07", "2025-03-08", "2025-03-20"],
+    # Empty middle months
+    ["2025-01-15", "2025-01-16", "2025-05-02", "2025-05-30"],
+    # Month boundary
+    ["2025-02-27", "2025-02-28", "2025-03-01", "2025-03-02"],
+    # Year boundary, across a leap day
+    ["2023-12-30", "2023-12-31", "2024-01-01", "2024-02-29", "2024-03-01"],
+    # Single date
+    ["2025-06-10"],
+])
+def test_rollup_matches_baseline(dates):
+    selected_dates = to_datetimes(dates)
+    predictions = np.linspace(0.5, 7.25, len(dates))
+
+    assert_rollups_match(
+        rollup_daily_predictions(selected_dates, predictions),
+        baseline_rollup(selected_dates, predictions)
+    )
+
+
+def test_rollup_matches_baseline_on_random_selections():
+    rng = np.random.default_rng(26)
+    for _ in range(50):
+        start = np.datetime64("2023-01-01") + rng.integers(0, 900)
+        offsets = np.unique(np.concatenate([[0], rng.integers(0, 800, size=rng.integers(1, 40))]))
+        dates = (start + offsets).astype(str).tolist()
+        selected_dates = to_datetimes(dates)
+        predictions = rng.random(len(dates)) * 20
+
+        assert_rollups_match(
+            rollup_daily_predictions(selected_dates, predictions),
+            baseline_rollup(selected_dates, predictions)
+        )
+
+
+def test_rollup_sums_duplicate_dates():
+    selected_dates = to_datetimes(["2025-03-11", "2025-03-11", "2025-03-12"])
+    predictions = np.array([1.0, 2.0, 3.0])
+
+    result = rollup_daily_predictions(selected_dates, predictions)
+    expected = baseline_rollup(selected_dates, predictions)
+
+    # Same totals as the baseline, but one row per calendar day instead of a repeated row
+    assert result["totalEnergyUsage"] == expected["totalEnergyUsage"] == 6.0
+    assert result["total_monthly_forecast"] == expected["total_monthly_forecast"] == 6.0
+    assert result["all_dates"] == ["2025-03-11", "2025-03-12"]
+    assert [row["predicted_use"] for row in result["predicted_energy"]] == [3.0, 3.0]
+
+
+def test_format_selected_dates_sorts_and_drops_repeats():
+    # Overlapping calendar ranges send the same day twice
+    selected = ["Wed Mar 12 2025", "Tue Mar 11 2025", "Wed Mar 12 2025", "Thu Mar 13 2025"]
+
+    assert format_selected_dates(selected) == ["2025-03-11", "2025-03-12", "2025-03-13"]
+
+
+def test_format_selected_dates_rejects_other_formats():
+    with pytest.raises(ValueError):
+        format_selected_dates(["2025-03-11"])
+
+
+def test_year_chunks_split_on_calendar_years():
+    dates = ["2025-11-30", "2025-12-31", "2026-01-01", "2026-06-15", "2028-02-29"]
+
+    assert list(year_chunks(dates)) == [
+        ["2025-11-30", "2025-12-31"],
+        ["2026-01-01", "2026-06-15"],
+        ["2028-02-29"]
+    ]
+
+
+def test_multi_year_selection_only_requests_past_archive_weather():
+    today = date(2026, 10, 19)
+    # Every third day from Nov 2024 to early 2029: past, current and several future years
+    dates = [
+        (date(2024, 11, 1) + timedelta(days=offset)).strftime("%Y-%m-%d") for offset in range(0, 1560, 3)
+    ]
+
+    chunks = list(year_chunks(dates))
+    ranges = [archive_weather_range(chunk[0], chunk[-1], today=today) for chunk in chunks]
+
+    assert [chunk[0][:4] for chunk in chunks] == ["2024", "2025", "2026", "2027", "2028", "2029"]
+    assert [start[:4] for start, _ in ranges] == ["2023", "2024", "2025", "2025", "2025", "2025"]
+    for (start, end), chunk in zip(ranges, chunks):
+        assert start <= end
+        assert end < f"{today.year}-01-01"
+        assert (start[5:], end[5:]) == (chunk[0][5:], chunk[-1][5:])
+
+
+def test_archive_weather_range_maps_leap_day_into_non_leap_year():
+    assert archive_weather_range("2028-02-01", "2028-02-29", today=date(2026, 10, 19)) == ("2025-02-01", "2025-02-28")
+    assert archive_weather_range("2025-02-01", "2025-02-28", today=date(2026, 10, 19)) == ("2024-02-01", "2024-02-28")
+
+
+def test_archive_weather_range_rejects_ranges_spanning_years():
+    with pytest.raises(ValueError):
+        archive_weather_range("2025-12-30", "2026-01-02")
+
+
+def archive_summary(start, end):
+    """Daily summaries shaped like _fetch_weather_archive output, with the day of year as temperature."""
+    days = []
+    current = start
+    while current <= end:
+        days.append({"month": current.month, "day": current.day, "avg_temperature": float(current.timetuple().tm_yday)})
+        current += timedelta(days=1)
+    return days
+
+
+def test_leap_day_uses_feb_28_weather_from_a_non_leap_archive_year():
+    today = date(2026, 10, 19)
+    start, end = archive_weather_range("2028-02-27", "2028-03-01", today=today)
+    archive = archive_summary(datetime.strptime(start, "%Y-%m-%d"), datetime.strptime(end, "%Y-%m-%d"))
+
+    dated = weather_for_dates(archive, ["2028-02-27", "2028-02-28", "2028-02-29", "2028-03-01"], today=today)
+
+    assert [record["date"] for record in dated] == ["2028-02-27", "2028-02-28", "2028-02-29", "2028-03-01"]
+    assert [(record["month"], record["day"]) for record in dated] == [(2, 27), (2, 28), (2, 29), (3, 1)]
+    # Feb 29 carries Feb 28's archive weather (day 59 of 2025), not a missing record
+    assert [record["avg_temperature"] for record in dated] == [58.0, 59.0, 59.0, 60.0]
+
+    # generate_simulated_data looks weather up by the record's (month, day), so the leap day now hits
+    weather_dict = {(record["month"], record["day"]): record for record in dated}
+    assert weather_dict[(2, 29)]["avg_temperature"] == 59.0
+
+
+def test_weather_for_dates_returns_one_record_per_selected_date():
+    today = date(2026, 10, 19)
+    archive = archive_summary(datetime(2025, 1, 1), datetime(2025, 12, 31))
+    selected = ["2027-03-05", "2027-03-09", "2028-03-05", "2029-03-05"]
+
+    dated = [
+        record
+        for chunk in year_chunks(selected)
+        for record in weather_for_dates(archive, chunk, today=today)
+    ]
+
+    # Future years share the 2025 archive, but each record is labelled with its own forecast date
+    assert [record["date"] for record in dated] == selected
+    assert len({record["date"] for record in dated}) == len(selected)
+
+
+def test_weather_for_dates_leaves_out_days_missing_from_the_archive():
+    archive = [{"month": 3, "day": 5, "avg_temperature": 30.0}]
+
+    dated = weather_for_dates(archive, ["2026-03-05", "2026-03-06"], today=date(2026, 10, 19))
+
+    assert [record["date"] for record in dated] == ["2026-03-05"]
@@ -0,0 +1,87 @@
+import threading
+import time
+
+import pytest
+
+from singleflight import SingleFlight
+
+FOLLOWERS = 8
+
+
+class LeaderCancelled(BaseException):
+    pass
+
+
+def run_concurrently(flight, fetch):
+    """Starts a leader plus followers on one key and returns each caller's (result, error)."""
+    outcomes = []
+    outcomes_lock = threading.Lock()
+
+    def caller():
+        try:
+            outcome = (flight.do("key", fetch), None)
+        except BaseException as e:
+            outcome = (None, e)
+        with outcomes_lock:
+            outcomes.append(outcome)
+
+    threads = [threading.Thread(target=caller) for _ in range(FOLLOWERS + 1)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=5)
+    assert not any(thread.is_alive() for thread in threads)
+    return outcomes
+
+
+def blocking_fetch(flight, upstream_calls, outcome):
+    """Builds a fetch that waits until every caller has joined the flight before finishing."""
+    def fetch():
+        upstream_calls.append(1)
+        deadline = time.monotonic() + 5
+        while flight.stats()["calls"] < FOLLOWERS + 1 and time.monotonic() < deadline:
+            time.sleep(0.001)
+        return outcome()
+    return fetch
+
+
+def test_concurrent_callers_share_one_result():
+    flight = SingleFlight("weather")
+    upstream_calls = []
+    shared = {"hourly": []}
+
+    outcomes = run_concurrently(flight, blocking_fetch(flight, upstream_calls, lambda: shared))
+
+    assert len(upstream_calls) == 1
+    assert all(result is shared and error is None for result, error in outcomes)
+    assert flight.stats() == {
+        "calls": FOLLOWERS + 1,
+        "upstreamCalls": 1,
+        "coalescedCalls": FOLLOWERS,
+        "coalescingRatio": round(FOLLOWERS / (FOLLOWERS + 1), 4)
+    }
+
+
+@pytest.mark.parametrize("error_type", [ValueError, LeaderCancelled])
+def test_concurrent_callers_share_the_leader_error(error_type):
+    flight = SingleFlight("tariff")
+    upstream_calls = []
+    error = error_type("upstream failed")
+
+    def fail():
+        raise error
+
+    outcomes = run_concurrently(flight, blocking_fetch(flight, upstream_calls, fail))
+
+    assert len(upstream_calls) == 1
+    assert len(outcomes) == FOLLOWERS + 1
+    assert all(result is None and raised is error for result, raised in outcomes)
+
+
+def test_key_is_released_after_a_call_completes():
+    flight = SingleFlight("consumption")
+
+    with pytest.raises(ValueError):
+        flight.do("key", lambda: (_ for _ in ()).throw(ValueError("down")))
+    assert flight.do("key", lambda: "recovered") == "recovered"
+    assert flight.stats()["upstreamCalls"] == 2